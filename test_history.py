@@ -0,0 +1,73 @@
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent
+
+
+def load_app(tmp_path):
+    # Import a copy of main.py so the stores read and write under tmp_path, not the repo's data files
+    for name in ("main.py", "medical_kb.json"):
+        shutil.copy(ROOT / name, tmp_path / name)
+    spec = importlib.util.spec_from_file_location("medisync_main", tmp_path / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_medrag_history_item(tmp_path):
+    main = load_app(tmp_path)
+    with TestClient(main.app) as client:
+        r = client.post("/api/auth/login", json={"email": "doctor@hospital.com", "password": "password123"})
+        headers = {"Authorization": f"Bearer {r.json()['token']}"}
+
+        client.post("/api/rag/search", json={"query": "type 1 diabetes"}, headers=headers)
+
+        history = client.get("/api/user/history", headers=headers).json()
+        rag_items = [h for h in history if h["type"] == "medrag_query"]
+        assert len(rag_items) == 1
+
+        r = client.get(f"/api/user/history/{rag_items[0]['id']}", headers=headers)
+        assert r.status_code == 200
+        item = r.json()
+        assert item["type"] == "medrag_query"
+        assert item["details"]["query"] == "type 1 diabetes"
+
+        # Another user's token must not see it
+        r = client.post("/api/auth/register", json={"name": "Other", "email": "other@x.com", "password": "longpassword"})
+        other = {"Authorization": f"Bearer {r.json()['token']}"}
+        assert client.get(f"/api/user/history/{rag_items[0]['id']}", headers=other).status_code == 404
+
+
+def test_history_limit(tmp_path):
+    main = load_app(tmp_path)
+    with TestClient(main.app) as client:
+        r = client.post("/api/auth/login", json={"email": "doctor@hospital.com", "password": "password123"})
+        headers = {"Authorization": f"Bearer {r.json()['token']}"}
+        for message in ("hello", "I feel stressed", "I can't sleep", "thanks"):
+            client.post("/api/mental-health", json={"message": message}, headers=headers)
+        client.post("/api/rag/search", json={"query": "type 1 diabetes"}, headers=headers)
+
+        full = client.get("/api/user/history", headers=headers).json()
+        assert len(full) >= 5
+        for n in (1, 3, len(full), len(full) + 5):
+            assert client.get("/api/user/history", params={"limit": n}, headers=headers).json() == full[:n]
+        for bad in (0, -1):
+            assert client.get("/api/user/history", params={"limit": bad}, headers=headers).status_code == 422
+
+
+def test_urgent_queue_limit(tmp_path):
+    main = load_app(tmp_path)
+    # Tied scores check that the limited call keeps the full sort's order
+    main.urgent_queue_db[:] = [{"name": f"p{i}", "score": score} for i, score in enumerate([3, 9, 5, 9, 1, 5, 7])]
+    with TestClient(main.app) as client:
+        full = client.get("/api/risk/urgent").json()["patients"]
+        assert [p["score"] for p in full] == [9, 9, 7, 5, 5, 3, 1]
+        for n in (1, 2, 4, len(full), len(full) + 1):
+            assert client.get("/api/risk/urgent", params={"limit": n}).json()["patients"] == full[:n]
+        for bad in (0, -1):
+            assert client.get("/api/risk/urgent", params={"limit": bad}).status_code == 422
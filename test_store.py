@@ -0,0 +1,97 @@
+import asyncio
+
+from test_history import load_app
+
+
+def test_journal_replay(tmp_path):
+    main = load_app(tmp_path)
+
+    async def write():
+        store = main.JSONLStore(tmp_path / "records.json")
+        a = {"id": "a", "user_id": "u1", "value": 1}
+        await store.append(a)
+        await store.append({"id": "b", "user_id": "u2", "value": 1})
+        a["value"] = 2
+        await store.update(a)
+        await store.append({"id": "c", "user_id": "u1", "value": 1})
+        await store.flush()
+
+    asyncio.run(write())
+
+    store = main.JSONLStore(tmp_path / "records.json")
+    store.load()
+    # The update's line wins, and "a" keeps its original position
+    assert [(r["id"], r["value"]) for r in store.records] == [("a", 2), ("b", 1), ("c", 1)]
+    assert [r["id"] for r in store.for_user("u1")] == ["a", "c"]
+
+
+def test_corrupt_journal_line_skipped(tmp_path):
+    main = load_app(tmp_path)
+    (tmp_path / "records.jsonl").write_bytes(b'{"id": "a"}\n{"id": "b", "us\n{"id": "c"}\n')
+
+    store = main.JSONLStore(tmp_path / "records.json")
+    store.load()
+    assert [r["id"] for r in store.records] == ["a", "c"]
+
+
+def test_flush_retries_failed_batch(tmp_path):
+    main = load_app(tmp_path)
+    main.AIOFILES_OK = False
+
+    async def write():
+        store = main.JSONLStore(tmp_path / "records.json")
+        append_lines = store._append_lines
+        calls = []
+
+        def fail_once(data):
+            calls.append(data)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            append_lines(data)
+
+        store._append_lines = fail_once
+        await store.append({"id": "a"})
+        await store.flush()
+        assert len(store._pending) == 1
+        await store.append({"id": "b"})
+        await store.flush()
+        assert store._pending == []
+
+    asyncio.run(write())
+
+    store = main.JSONLStore(tmp_path / "records.json")
+    store.load()
+    assert [r["id"] for r in store.records] == ["a", "b"]
+
+
+def test_compact(tmp_path):
+    main = load_app(tmp_path)
+
+    async def write():
+        store = main.JSONLStore(tmp_path / "records.json", flush_delay=60)
+        await store.append({"id": "a"})
+        await store.flush()
+        await store.append({"id": "b"})
+        await store.append({"id": "c"})
+        # "b" and "c" are still queued; the snapshot picks them up
+        await store.compact()
+        assert store._pending == []
+        assert store._appended == 0
+
+    asyncio.run(write())
+
+    assert (tmp_path / "records.jsonl").read_bytes() == b""
+    store = main.JSONLStore(tmp_path / "records.json")
+    store.load()
+    assert [r["id"] for r in store.records] == ["a", "b", "c"]
+
+
+def test_for_users_matches_scan(tmp_path):
+    main = load_app(tmp_path)
+    owners = ["u1", None, "u2", "u1", None, "u3", "u1", "u2", None]
+    records = [{"id": str(i), "user_id": owner} for i, owner in enumerate(owners)]
+    store = main.JSONLStore(tmp_path / "records.json", seed=records)
+
+    for uid in ("u1", "u2", "u3", "missing"):
+        expected = [r for r in records if r.get("user_id") == uid or r.get("user_id") is None]
+        assert store.for_users(uid, None) == expected
@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+from test_history import load_app
+
+
+def test_wellness_reply_cache(tmp_path, monkeypatch):
+    main = load_app(tmp_path)
+    sent = []
+
+    def fake_reply(message):
+        sent.append(message)
+        return f"reply {len(sent)}"
+
+    monkeypatch.setattr(main, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(main, "_openai_wellness_reply", fake_reply)
+
+    with TestClient(main.app) as client:
+        def register(email):
+            r = client.post("/api/auth/register", json={"name": email, "email": email, "password": "longpassword"})
+            return {"Authorization": f"Bearer {r.json()['token']}"}
+
+        alice, bob = register("alice@x.com"), register("bob@x.com")
+
+        def chat(message, headers=None):
+            return client.post("/api/mental-health", json={"message": message}, headers=headers).json()["response"]
+
+        first = chat("I feel  Anxious today", alice)
+        # The model sees exactly what the user typed
+        assert sent == ["I feel  Anxious today"]
+
+        # The same user repeating themselves (modulo case/whitespace) reuses the reply
+        assert chat("i feel anxious today", alice) == first
+        assert len(sent) == 1
+
+        # Another user never gets it
+        assert chat("I feel  Anxious today", bob) != first
+        assert len(sent) == 2
+
+        # Anonymous chats always go to the model
+        chat("I feel anxious today")
+        chat("I feel anxious today")
+        assert len(sent) == 4